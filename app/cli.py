@@ -2,7 +2,9 @@ import typer
 
 from conf.config import Conf
 from providers.TilesGeometryProvider import TilesGeometryProvider
+from providers.TilesWorkQueue import TilesWorkQueue
 from providers.satellite_images.download_images import download_satellite_images
+from utils import utils
 
 # Typer CLI app
 app = typer.Typer()
@@ -21,5 +23,36 @@ def create_tiles(raster_file_path: str, shape_file_path: str, arrays_folder: str
     tiles_geometry_provider.save_tile_arrays(raster_file_path, shape_file_path, arrays_folder, start, stride, bands)
 
 
+@app.command()
+def queue_tiles(raster_file_path: str, shape_file_path: str, queue_dir: str, start: int, stride: int) -> None:
+    bands = Conf().get_property("raster_files", "bands")
+
+    tiles_coordinates = TilesGeometryProvider().get_tiles_coordinates(raster_file_path, start, stride)
+
+    job = {"raster_file_path": raster_file_path, "shape_file_path": shape_file_path, "bands": bands}
+    TilesWorkQueue(queue_dir).create(job, tiles_coordinates)
+
+
+@app.command()
+def work_tiles(queue_dir: str) -> None:
+    queue = TilesWorkQueue(queue_dir)
+    job = queue.load_job()
+
+    tiles_geometry_provider = TilesGeometryProvider()
+
+    # Loaded once per worker, shared by every unit it processes
+    raster_meta = utils.load_raster(job.get("raster_file_path")).meta
+    coverage_engine = tiles_geometry_provider.get_coverage_engine(job.get("shape_file_path"))
+
+    queue.run_worker(lambda unit, arrays_folder: tiles_geometry_provider.save_work_unit_arrays(
+        job.get("raster_file_path"), raster_meta, coverage_engine, arrays_folder, unit.get("tiles_coordinates"),
+        job.get("bands")))
+
+
+@app.command()
+def merge_tiles(queue_dir: str) -> None:
+    TilesWorkQueue(queue_dir).merge()
+
+
 if __name__ == '__main__':
     app()
@@ -0,0 +1,65 @@
+import numpy as np
+import shapely
+from geopandas import GeoDataFrame, GeoSeries
+from pyproj import CRS, Transformer
+from shapely.geometry import Polygon
+
+from providers.data.dataclasses import TileParams
+
+
+class TilesCoverageEngine:
+    """
+    Select the parcels of the AOI kept in a tile and compute the percentage of the tile they cover.
+
+    The AOI is exploded into parcels and reprojected to an equal-area CRS only once, caching the area of each parcel.
+    Parcels inside the tile use the cached area and only the pieces cut by the tile border are transformed (with a
+    transformer created once), instead of reprojecting the clipped geometries of every tile.
+    """
+
+    EQUAL_AREA_CRS = {'proj': 'cea'}
+
+    def __init__(self, aoi: GeoDataFrame, tile_params: TileParams) -> None:
+        self.tile_params = tile_params
+        self.crs = aoi.crs
+
+        self.parcels = aoi.geometry.explode(ignore_index=True)
+        self.parcel_geometries = self.parcels.to_numpy()
+        self.parcel_areas = self.parcels.to_crs(self.EQUAL_AREA_CRS).area.to_numpy()
+
+        self.transformer = Transformer.from_crs(self.crs, CRS.from_user_input(self.EQUAL_AREA_CRS), always_xy=True)
+        self.tile_area = tile_params.height * tile_params.width * tile_params.pixel_size ** 2
+
+    def _get_equal_area(self, geometries: np.ndarray) -> np.ndarray:
+        """Area of the geometries in the equal-area CRS."""
+
+        equal_area_geometries = shapely.transform(
+            geometries, lambda xy: np.column_stack(self.transformer.transform(xy[:, 0], xy[:, 1])))
+
+        return shapely.area(equal_area_geometries)
+
+    def get_tile_coverage(self, tile_polygon: Polygon) -> tuple[GeoSeries | None, float]:
+        """
+        Get the polygons of the tile bigger than the minimum area (without multi polygons) and the percentage of the
+        tile covered by them.
+        """
+
+        candidates = self.parcels.sindex.query(tile_polygon, predicate="intersects")
+
+        if len(candidates) == 0:
+            return None, 0.0
+
+        geometries = self.parcel_geometries[candidates]
+        inside = shapely.covers(tile_polygon, geometries)
+
+        # Multipolygon to Polygon
+        border_geometries = shapely.get_parts(shapely.intersection(geometries[~inside], tile_polygon))
+
+        tile_geometries = np.concatenate((geometries[inside], border_geometries))
+        areas = np.concatenate((self.parcel_areas[candidates][inside], self._get_equal_area(border_geometries)))
+
+        kept = areas > self.tile_params.min_geometry_area
+
+        if not kept.any():
+            return None, 0.0
+
+        return GeoSeries(tile_geometries[kept], crs=self.crs), areas[kept].sum() / self.tile_area
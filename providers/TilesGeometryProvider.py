@@ -3,7 +3,6 @@ import logging
 import os.path
 from pathlib import Path
 
-import geopandas as gdf
 import numpy as np
 import rasterio
 from geopandas import GeoDataFrame, GeoSeries
@@ -13,6 +12,7 @@ from shapely import geometry, affinity
 from shapely.geometry import Polygon
 
 from conf.config import Conf
+from providers.TilesCoverageEngine import TilesCoverageEngine
 from providers.data.dataclasses import TileParams
 from utils import utils
 
@@ -46,27 +46,6 @@ class TilesGeometryProvider:
         return geometry.Polygon(
             [[self.tile_params.height - y, x] for x, y in zip(x_coordinates, y_coordinates)])
 
-    def __get_tile_geometry(self, aoi: GeoDataFrame, tile_polygon: geometry.Polygon) -> GeoSeries | None:
-        """
-        Make sure that the gdf is composed only of polygons (without multi polygons).
-        """
-
-        clipped_geometry = gdf.clip(aoi.geometry, tile_polygon)
-
-        if clipped_geometry.empty:
-            return None
-
-        # Multipolygon to Polygon
-        geometry_tile = clipped_geometry.explode(ignore_index=True)
-
-        return geometry_tile[geometry_tile.geometry.to_crs({'proj': 'cea'}).area > 5000]
-
-    def __get_percentage_covered_geometry(self, tile_geometry: GeoSeries) -> float:
-        """Calculate the percentage of geometry in the tile."""
-
-        tile_area = self.tile_params.height * self.tile_params.width * self.tile_params.pixel_size ** 2
-        return tile_geometry.to_crs({'proj': 'cea'}).geometry.area.sum() / tile_area
-
     def _get_tiles_coordinates(self, raster_width: int, raster_height: int, start: int, stride: int) -> list:
         """Define boxes range."""
 
@@ -77,17 +56,16 @@ class TilesGeometryProvider:
                 x + stride < raster_width or y + stride < raster_height]
 
     def _get_filtered_gdf_tile(
-            self, aoi: GeoDataFrame, tile_window: Window, raster_meta: dict
+            self, coverage_engine: TilesCoverageEngine, tile_window: Window, raster_meta: dict
     ) -> GeoDataFrame | None:
 
         tile_spatial_bounds = rasterio.windows.bounds(tile_window, raster_meta.get("transform"))
 
         tile_polygon = geometry.box(*tile_spatial_bounds, ccw=False)
 
-        geometry_tile = self.__get_tile_geometry(aoi, tile_polygon)
+        geometry_tile, percentage_covered_geometry = coverage_engine.get_tile_coverage(tile_polygon)
 
-        if geometry_tile is not None and self.__get_percentage_covered_geometry(
-                geometry_tile) > self.tile_params.min_percentage_covered_geometry:
+        if geometry_tile is not None and percentage_covered_geometry > self.tile_params.min_percentage_covered_geometry:
             # Scale to pixels
             scaled_geometry_tile = geometry_tile.apply(
                 lambda polygon: self.__scale_to_pixel_coordinates(polygon, tile_spatial_bounds))
@@ -98,23 +76,39 @@ class TilesGeometryProvider:
             return scaled_geometry_tile
         return None
 
+    def get_tiles_coordinates(self, raster_file_path: str, start: int, stride: int) -> list:
+        raster = utils.load_raster(raster_file_path)
+
+        return self._get_tiles_coordinates(raster.meta.get("width"), raster.meta.get("height"), start, stride)
+
+    def get_coverage_engine(self, shape_file_path: str) -> TilesCoverageEngine:
+        aoi = utils.load_gdf_shape_file(shape_file_path)
+
+        return TilesCoverageEngine(aoi, self.tile_params)
+
     def get_tile_geometries(
             self, raster_file_path: str, shape_file_path: str, start: int, stride: int
     ) -> list:
 
         raster = utils.load_raster(raster_file_path)
-        aoi = utils.load_gdf_shape_file(shape_file_path)
-
-        tile_geometries = []
+        coverage_engine = self.get_coverage_engine(shape_file_path)
 
         tiles_coordinates = self._get_tiles_coordinates(
             raster.meta.get("width"), raster.meta.get("height"), start, stride)
 
+        return self.get_tile_geometries_from_coordinates(raster.meta, coverage_engine, tiles_coordinates)
+
+    def get_tile_geometries_from_coordinates(
+            self, raster_meta: dict, coverage_engine: TilesCoverageEngine, tiles_coordinates: list
+    ) -> list:
+
+        tile_geometries = []
+
         count = 0
         for (col_off, row_off) in tiles_coordinates:
 
             tile_window = Window(col_off, row_off, self.tile_params.width, self.tile_params.height)
-            filtered_tile_geometry = self._get_filtered_gdf_tile(aoi, tile_window, raster.meta)
+            filtered_tile_geometry = self._get_filtered_gdf_tile(coverage_engine, tile_window, raster_meta)
 
             if filtered_tile_geometry is not None:
                 count += 1
@@ -157,6 +151,12 @@ class TilesGeometryProvider:
 
         return arrays
 
+    def _get_raster_id(self, raster_file_path: str) -> str:
+        raster_id = raster_file_path.split("/")[-1]
+        raster_id = raster_id.split("-")
+
+        return f"{raster_id[0].replace('raster_', '')}_{raster_id[2].replace('.tif', '')}"
+
     def save_tile_arrays(
             self,
             raster_file_path: str,
@@ -169,9 +169,34 @@ class TilesGeometryProvider:
         tile_geometries = self.get_tile_geometries(raster_file_path, shape_file_path, start, stride)
         tile_arrays = self.get_tile_arrays(raster_file_path, tile_geometries, bands)
 
-        raster_id = raster_file_path.split("/")[-1]
-        raster_id = raster_id.split("-")
-        raster_id = f"{raster_id[0].replace('raster_', '')}_{raster_id[2].replace('.tif', '')}"
+        raster_id = self._get_raster_id(raster_file_path)
 
         for n, array in enumerate(tile_arrays):
             np.save(os.path.join(arrays_folder, f"array_{n}_{raster_id}"), array)
+
+    def save_work_unit_arrays(
+            self,
+            raster_file_path: str,
+            raster_meta: dict,
+            coverage_engine: TilesCoverageEngine,
+            arrays_folder: str,
+            tiles_coordinates: list,
+            bands: list
+    ) -> list[str]:
+        """
+        Save the arrays of a work unit of the queue. The raster meta and the coverage engine are loaded once per worker
+        and shared by its units. The files are named by window offsets to be unique.
+        """
+
+        tile_geometries = self.get_tile_geometries_from_coordinates(raster_meta, coverage_engine, tiles_coordinates)
+        tile_arrays = self.get_tile_arrays(raster_file_path, tile_geometries, bands)
+
+        raster_id = self._get_raster_id(raster_file_path)
+
+        file_names = []
+        for (_, tile_window), array in zip(tile_geometries, tile_arrays):
+            file_name = f"array_{tile_window.col_off}_{tile_window.row_off}_{raster_id}.npy"
+            np.save(os.path.join(arrays_folder, file_name), array)
+            file_names.append(file_name)
+
+        return file_names
@@ -0,0 +1,312 @@
+import json
+import logging
+import os
+import shutil
+import socket
+import threading
+import time
+import uuid
+from typing import Callable
+
+from conf.config import Conf
+from providers.data.dataclasses import WorkQueueParams
+
+logging.basicConfig(format='%(asctime)s %(levelname)s: %(message)s', level=logging.INFO)
+
+
+class TilesWorkQueue:
+    """
+    File based work queue used to share tile generation between several nodes.
+
+    The queue lives in a folder of a shared filesystem. Every work unit is a json file that is moved between the
+    `pending`, `leased` and `done` folders with `os.rename`, which is atomic, so no lock server or broker is needed.
+    The lease expiry is stored as the mtime of the leased file, set with the clock of the node holding the lease (a
+    plain touch would use the file server clock on NFS). A leased unit whose expiry has passed is moved back to
+    `pending`, so the clocks of the nodes must be kept in sync (e.g. with NTP), with a skew much smaller than
+    `lease_seconds`. Every claim counts as an attempt, so a unit whose processing has raised or killed its worker
+    `max_attempts` times is moved to `failed`.
+    """
+
+    JOB_FILE = "job.json"
+    INDEX_FILE = "index.json"
+    MANIFEST_FILE = "manifest.json"
+
+    def __init__(self, queue_dir: str, params: WorkQueueParams | None = None) -> None:
+        self.queue_dir = queue_dir
+        self.params = params or WorkQueueParams(**Conf().get_section("work_queue"))
+
+        self.pending_dir = os.path.join(queue_dir, "pending")
+        self.leased_dir = os.path.join(queue_dir, "leased")
+        self.done_dir = os.path.join(queue_dir, "done")
+        self.failed_dir = os.path.join(queue_dir, "failed")
+        self.results_dir = os.path.join(queue_dir, "results")
+
+    @staticmethod
+    def _write_json(file_path: str, content: dict, mtime: float | None = None) -> None:
+        """Write a json file atomically (write a temporary file and rename it), optionally with a given mtime."""
+
+        tmp_file_path = f"{file_path}.{uuid.uuid4().hex}.tmp"
+        with open(tmp_file_path, "w") as f:
+            json.dump(content, f)
+        if mtime is not None:
+            os.utime(tmp_file_path, (mtime, mtime))
+        os.replace(tmp_file_path, file_path)
+
+    @staticmethod
+    def _read_json(file_path: str) -> dict:
+        with open(file_path) as f:
+            return json.load(f)
+
+    @staticmethod
+    def _unit_id(file_name: str) -> str:
+        """Get the unit id from a pending, leased or done file name (`unit_000001[.worker].json`)."""
+        return file_name.split(".")[0]
+
+    def _list_units(self, folder: str) -> list:
+        return sorted(name for name in os.listdir(folder) if name.startswith("unit_") and name.endswith(".json"))
+
+    def create(self, job: dict, tiles_coordinates: list) -> int:
+        """Partition the tiles coordinates into work units and write them as pending."""
+
+        if os.path.exists(os.path.join(self.queue_dir, self.JOB_FILE)):
+            raise FileExistsError(f"A work queue already exists at: folder [{self.queue_dir}]")
+
+        for folder in (self.pending_dir, self.leased_dir, self.done_dir, self.failed_dir, self.results_dir):
+            os.makedirs(folder, exist_ok=True)
+
+        size = self.params.windows_per_unit
+        units = [tiles_coordinates[i:i + size] for i in range(0, len(tiles_coordinates), size)]
+
+        for n, unit_coordinates in enumerate(units):
+            unit_id = f"unit_{n:06d}"
+            self._write_json(
+                os.path.join(self.pending_dir, f"{unit_id}.json"),
+                {"unit_id": unit_id, "tiles_coordinates": unit_coordinates})
+
+        # The job file is written last: workers only start once the queue is complete
+        self._write_json(os.path.join(self.queue_dir, self.JOB_FILE), job)
+
+        logging.info(f"Have been queued {len(units)} work units...")
+        return len(units)
+
+    def load_job(self) -> dict:
+        return self._read_json(os.path.join(self.queue_dir, self.JOB_FILE))
+
+    def requeue_expired(self) -> int:
+        """Move back to pending the leased units whose lease has expired."""
+
+        count = 0
+        now = time.time()
+
+        for name in self._list_units(self.leased_dir):
+            leased_file_path = os.path.join(self.leased_dir, name)
+            try:
+                if os.stat(leased_file_path).st_mtime >= now:
+                    continue
+                os.rename(leased_file_path, os.path.join(self.pending_dir, f"{self._unit_id(name)}.json"))
+            except FileNotFoundError:
+                # Committed or requeued by another process in the meantime
+                continue
+
+            count += 1
+            logging.warning(f"Lease expired, unit requeued: file [{name}]")
+
+        return count
+
+    def _get_lease_expiry(self) -> float:
+        return time.time() + self.params.lease_seconds
+
+    def _set_lease_expiry(self, leased_file_path: str) -> None:
+        expiry = self._get_lease_expiry()
+        os.utime(leased_file_path, (expiry, expiry))
+
+    def claim(self, worker_id: str) -> tuple[dict, str] | None:
+        """Lease the first available pending unit. Returns the unit and its leased file path."""
+
+        for name in self._list_units(self.pending_dir):
+            leased_file_path = os.path.join(self.leased_dir, f"{self._unit_id(name)}.{worker_id}.json")
+            pending_file_path = os.path.join(self.pending_dir, name)
+            try:
+                # The rename keeps the mtime: the expiry is set before, so a leased file never looks expired
+                self._set_lease_expiry(pending_file_path)
+                os.rename(pending_file_path, leased_file_path)
+                unit = self._read_json(leased_file_path)
+            except FileNotFoundError:
+                # Claimed by another worker
+                continue
+
+            unit_id = unit.get("unit_id")
+
+            if unit.get("attempts", 0) >= self.params.max_attempts:
+                # The previous attempts raised or killed their workers
+                self._move_to_failed(unit, leased_file_path)
+                continue
+
+            # Counted when claimed, so an attempt that kills the worker is counted too
+            unit = {**unit, "attempts": unit.get("attempts", 0) + 1}
+            self._write_json(leased_file_path, unit, mtime=self._get_lease_expiry())
+
+            logging.info(f"Unit claimed (attempt {unit.get('attempts')}): unit [{unit_id}]")
+            return unit, leased_file_path
+
+        return None
+
+    def renew(self, leased_file_path: str) -> bool:
+        """Extend a lease. Returns False if the lease has been lost."""
+
+        try:
+            self._set_lease_expiry(leased_file_path)
+            return True
+        except FileNotFoundError:
+            return False
+
+    def _heartbeat(self, leased_file_path: str, processed: threading.Event) -> None:
+        """Renew the lease every third of `lease_seconds` until the unit is processed or the lease is lost."""
+
+        while not processed.wait(self.params.lease_seconds / 3):
+            if not self.renew(leased_file_path):
+                return
+
+    def commit(self, unit: dict, leased_file_path: str, tmp_results_dir: str, arrays: list) -> bool:
+        """Publish the results of a leased unit and mark it as done. Returns False if the lease has been lost."""
+
+        unit_id = unit.get("unit_id")
+
+        if not os.path.exists(leased_file_path):
+            shutil.rmtree(tmp_results_dir, ignore_errors=True)
+            return False
+
+        try:
+            self._write_json(os.path.join(tmp_results_dir, self.MANIFEST_FILE), {**unit, "arrays": arrays})
+        except FileNotFoundError:
+            # Lease lost and the temporary results removed as stale by the merge
+            return False
+
+        try:
+            os.rename(tmp_results_dir, os.path.join(self.results_dir, unit_id))
+        except OSError:
+            # The results have already been published by a worker holding an older lease
+            shutil.rmtree(tmp_results_dir, ignore_errors=True)
+
+        try:
+            os.rename(leased_file_path, os.path.join(self.done_dir, f"{unit_id}.json"))
+        except FileNotFoundError:
+            # Lease expired while publishing: the unit will be processed again and the published results kept
+            return False
+
+        return True
+
+    def _move_to_failed(self, unit: dict, leased_file_path: str) -> None:
+        unit_id = unit.get("unit_id")
+        try:
+            os.rename(leased_file_path, os.path.join(self.failed_dir, f"{unit_id}.json"))
+        except FileNotFoundError:
+            # Lease lost, the unit is already back in pending
+            return
+
+        logging.error(f"Unit failed {unit.get('attempts')} times, moved to failed: unit [{unit_id}]")
+
+    def release(self, unit: dict, leased_file_path: str) -> None:
+        """Give back a unit whose processing has failed: to pending, or to failed after `max_attempts` attempts."""
+
+        if unit.get("attempts", 0) >= self.params.max_attempts:
+            self._move_to_failed(unit, leased_file_path)
+            return
+
+        try:
+            # The attempt has been recorded when claimed, the unit is moved in one step
+            os.rename(leased_file_path, os.path.join(self.pending_dir, f"{unit.get('unit_id')}.json"))
+        except FileNotFoundError:
+            # Lease lost, the unit is already back in pending
+            return
+
+    def is_finished(self) -> bool:
+        return not self._list_units(self.pending_dir) and not self._list_units(self.leased_dir)
+
+    def run_worker(self, process_unit: Callable[[dict, str], list], worker_id: str | None = None) -> int:
+        """
+        Claim and process units until the queue is finished. `process_unit` receives the unit and the folder where
+        its arrays must be saved, and returns the saved file names. Returns the number of units committed.
+        """
+
+        worker_id = worker_id or f"{socket.gethostname()}-{os.getpid()}"
+        count = 0
+
+        while True:
+            self.requeue_expired()
+            claimed = self.claim(worker_id)
+
+            if claimed is None:
+                if self.is_finished():
+                    return count
+                # Other workers hold the remaining leases, wait in case any of them expires
+                time.sleep(self.params.poll_seconds)
+                continue
+
+            unit, leased_file_path = claimed
+            tmp_results_dir = os.path.join(self.results_dir, f".{unit.get('unit_id')}.{worker_id}.tmp")
+            shutil.rmtree(tmp_results_dir, ignore_errors=True)
+            os.makedirs(tmp_results_dir)
+
+            # Keep the lease alive while the unit is processed
+            processed = threading.Event()
+            heartbeat = threading.Thread(target=self._heartbeat, args=(leased_file_path, processed), daemon=True)
+            heartbeat.start()
+            try:
+                arrays = process_unit(unit, tmp_results_dir)
+            except Exception as e:
+                logging.error(f"Could not process unit [{unit.get('unit_id')}]")
+                logging.error(f"Exception {e}", exc_info=True)
+                arrays = None
+            finally:
+                processed.set()
+                heartbeat.join()
+
+            if arrays is None:
+                shutil.rmtree(tmp_results_dir, ignore_errors=True)
+                self.release(unit, leased_file_path)
+                continue
+
+            if self.commit(unit, leased_file_path, tmp_results_dir, arrays):
+                count += 1
+                logging.info(f"Worker {worker_id} has committed {count} work units...")
+            else:
+                logging.warning(f"Lease lost, results discarded: unit [{unit.get('unit_id')}]")
+
+    def _remove_stale_tmp_files(self) -> None:
+        """Remove the temporary results and json files left by workers that died."""
+
+        for name in os.listdir(self.results_dir):
+            if name.startswith(".") and name.endswith(".tmp"):
+                logging.warning(f"Removing stale temporary results: folder [{name}]")
+                shutil.rmtree(os.path.join(self.results_dir, name), ignore_errors=True)
+
+        for folder in (self.pending_dir, self.leased_dir, self.done_dir, self.failed_dir):
+            for name in os.listdir(folder):
+                if name.endswith(".tmp"):
+                    os.remove(os.path.join(folder, name))
+
+    def merge(self) -> str:
+        """Build one index with the arrays of every done unit, listing the failed ones. Returns the index file path."""
+
+        if not self.is_finished():
+            raise RuntimeError(f"The work queue has units not yet done: folder [{self.queue_dir}]")
+
+        # No unit is leased anymore, so no worker is writing temporary files
+        self._remove_stale_tmp_files()
+
+        index = []
+        for name in self._list_units(self.done_dir):
+            unit_id = self._unit_id(name)
+            manifest = self._read_json(os.path.join(self.results_dir, unit_id, self.MANIFEST_FILE))
+            index.extend(os.path.join("results", unit_id, array) for array in manifest.get("arrays"))
+
+        failed = [self._unit_id(name) for name in self._list_units(self.failed_dir)]
+        if failed:
+            logging.error(f"The index does not include the arrays of the failed units: units {failed}")
+
+        index_file_path = os.path.join(self.queue_dir, self.INDEX_FILE)
+        self._write_json(index_file_path, {"job": self.load_job(), "arrays": index, "failed": failed})
+
+        logging.info(f"Have been indexed {len(index)} arrays...")
+        return index_file_path
@@ -7,3 +7,12 @@ class TileParams:
     height: int
     pixel_size: int
     min_percentage_covered_geometry: float
+    min_geometry_area: float = 5000
+
+
+@dataclass
+class WorkQueueParams:
+    windows_per_unit: int
+    lease_seconds: float
+    poll_seconds: float
+    max_attempts: int = 3
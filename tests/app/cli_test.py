@@ -0,0 +1,53 @@
+import json
+import numpy as np
+import os
+import rasterio
+import tempfile
+import unittest
+from geopandas import GeoDataFrame
+from rasterio.transform import from_origin
+from shapely.geometry import box
+
+from app.cli import merge_tiles, queue_tiles, work_tiles
+
+
+class CliTest(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+
+        # 1024x1024 pixels of 10 m, the AOI covers the first 768x768 pixels
+        self.raster_file_path = f"{self.tmp_dir.name}/raster_20210101_20210131-0000000000-0000000000.tif"
+        with rasterio.open(
+                self.raster_file_path, "w", driver="GTiff", width=1024, height=1024, count=6, dtype="float32",
+                crs="EPSG:32721", transform=from_origin(300000, 6200000, 10, 10)
+        ) as dst:
+            dst.write(np.ones((6, 1024, 1024), dtype="float32"))
+
+        self.shape_file_path = f"{self.tmp_dir.name}/aoi.shp"
+        GeoDataFrame(geometry=[box(300000, 6192320, 307680, 6200000)], crs="EPSG:32721").to_file(self.shape_file_path)
+
+    def tearDown(self):
+        self.tmp_dir.cleanup()
+
+    def test_queue_work_merge_tiles(self):
+        queue_dir = f"{self.tmp_dir.name}/queue"
+
+        queue_tiles(self.raster_file_path, self.shape_file_path, queue_dir, start=0, stride=256)
+        work_tiles(queue_dir)
+        merge_tiles(queue_dir)
+
+        with open(f"{queue_dir}/index.json") as f:
+            index = json.load(f)
+
+        self.assertEqual(self.raster_file_path, index.get("job").get("raster_file_path"))
+        self.assertEqual([], index.get("failed"))
+        self.assertEqual([
+            "results/unit_000000/array_0_0_20210101_20210131_0000000000.npy",
+            "results/unit_000000/array_0_256_20210101_20210131_0000000000.npy",
+            "results/unit_000000/array_256_0_20210101_20210131_0000000000.npy",
+            "results/unit_000000/array_256_256_20210101_20210131_0000000000.npy"
+        ], sorted(index.get("arrays")))
+
+        for array in index.get("arrays"):
+            self.assertTrue(os.path.exists(os.path.join(queue_dir, array)))
@@ -0,0 +1,84 @@
+import unittest
+
+import geopandas as gpd
+import shapely
+from geopandas import GeoDataFrame, GeoSeries
+from shapely import geometry
+
+from providers.TilesCoverageEngine import TilesCoverageEngine
+from providers.data.dataclasses import TileParams
+
+
+class TilesCoverageEngineTest(unittest.TestCase):
+
+    def setUp(self):
+        self.tile_params = TileParams(width=64, height=64, pixel_size=10, min_percentage_covered_geometry=0.5)
+        self.aoi = GeoDataFrame(geometry=[
+            geometry.box(-60.0, -34.0, -59.996, -33.996),
+            geometry.MultiPolygon([
+                geometry.box(-59.995, -34.0, -59.992, -33.997),
+                geometry.box(-59.9905, -34.0, -59.9904, -33.9999)
+            ])
+        ], crs="EPSG:4326")
+
+        self.utm_aoi = GeoDataFrame(geometry=[
+            geometry.box(300000, 6200000, 300400, 6200400),
+            geometry.MultiPolygon([
+                geometry.box(300500, 6200000, 300800, 6200300),
+                geometry.box(300950, 6200000, 300960, 6200010)
+            ])
+        ], crs="EPSG:32721")
+
+    def _get_reference_coverage(
+            self, aoi: GeoDataFrame, tile_polygon: geometry.Polygon
+    ) -> tuple[GeoSeries, float]:
+        """Coverage reprojecting the clipped geometries of the tile."""
+
+        tile_geometry = gpd.clip(aoi.geometry, tile_polygon).explode(ignore_index=True)
+        tile_geometry = tile_geometry[tile_geometry.to_crs({'proj': 'cea'}).area > self.tile_params.min_geometry_area]
+
+        tile_area = self.tile_params.height * self.tile_params.width * self.tile_params.pixel_size ** 2
+        return tile_geometry, tile_geometry.to_crs({'proj': 'cea'}).area.sum() / tile_area
+
+    def _assert_same_coverage(self, aoi: GeoDataFrame, tile_polygons: list) -> None:
+        sut = TilesCoverageEngine(aoi, self.tile_params)
+
+        for tile_polygon in tile_polygons:
+            expected_geometry, expected_percentage = self._get_reference_coverage(aoi, tile_polygon)
+
+            result_geometry, result_percentage = sut.get_tile_coverage(tile_polygon)
+
+            self.assertEqual(len(expected_geometry), len(result_geometry))
+            self.assertTrue(expected_percentage > 0)
+            self.assertAlmostEqual(expected_percentage, result_percentage, delta=expected_percentage * 1e-9)
+
+            expected_union = shapely.union_all(expected_geometry.values)
+            difference = shapely.symmetric_difference(expected_union, shapely.union_all(result_geometry.values))
+            self.assertLess(difference.area, expected_union.area * 1e-9)
+
+    def test_get_tile_coverage(self):
+        self._assert_same_coverage(self.aoi, [
+            geometry.box(-60.001, -34.001, -59.990, -33.990, ccw=False),
+            geometry.box(-59.998, -33.999, -59.993, -33.994, ccw=False)
+        ])
+
+    def test_get_tile_coverage_projected_crs(self):
+        self._assert_same_coverage(self.utm_aoi, [
+            geometry.box(299900, 6199900, 300540, 6200540, ccw=False),
+            geometry.box(300200, 6199950, 300840, 6200590, ccw=False)
+        ])
+
+    def test_get_tile_coverage_min_geometry_area(self):
+        self.tile_params.min_geometry_area = 200000
+        sut = TilesCoverageEngine(self.aoi, self.tile_params)
+
+        result = sut.get_tile_coverage(geometry.box(-60.001, -34.001, -59.990, -33.990, ccw=False))
+
+        self.assertEqual((None, 0.0), result)
+
+    def test_get_tile_coverage_empty(self):
+        sut = TilesCoverageEngine(self.aoi, self.tile_params)
+
+        result = sut.get_tile_coverage(geometry.box(-50.001, -34.001, -49.990, -33.990, ccw=False))
+
+        self.assertEqual((None, 0.0), result)
@@ -1,13 +1,21 @@
+import json
 import numpy as np
+import os
 import pickle
+import rasterio
+import tempfile
 import unittest
 from PIL import Image
-from geopandas import GeoSeries
+from geopandas import GeoDataFrame, GeoSeries
 from pathlib import Path
+from rasterio.transform import from_origin
 from rasterio.windows import Window
-from shapely.geometry import Polygon
+from shapely.geometry import Polygon, box
 
 from providers.TilesGeometryProvider import TilesGeometryProvider
+from providers.TilesWorkQueue import TilesWorkQueue
+from providers.data.dataclasses import WorkQueueParams
+from utils import utils
 
 
 class TilesGeometryProviderTest(unittest.TestCase):
@@ -100,3 +108,45 @@ class TilesGeometryProviderTest(unittest.TestCase):
             stride=128,
             bands=bands
         )
+
+    def test_save_work_unit_arrays(self):
+        sut = TilesGeometryProvider()
+
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            # 1024x1024 pixels of 10 m, the AOI covers the first 768x768 pixels
+            raster_file_path = f"{tmp_dir}/raster_20210101_20210131-0000000000-0000000000.tif"
+            with rasterio.open(
+                    raster_file_path, "w", driver="GTiff", width=1024, height=1024, count=6, dtype="float32",
+                    crs="EPSG:32721", transform=from_origin(300000, 6200000, 10, 10)
+            ) as dst:
+                dst.write(np.ones((6, 1024, 1024), dtype="float32"))
+
+            shape_file_path = f"{tmp_dir}/aoi.shp"
+            GeoDataFrame(geometry=[box(300000, 6192320, 307680, 6200000)], crs="EPSG:32721").to_file(shape_file_path)
+
+            queue = TilesWorkQueue(
+                f"{tmp_dir}/queue", WorkQueueParams(windows_per_unit=4, lease_seconds=60, poll_seconds=0))
+            queue.create({}, sut.get_tiles_coordinates(raster_file_path, start=0, stride=256))
+
+            raster_meta = utils.load_raster(raster_file_path).meta
+            coverage_engine = sut.get_coverage_engine(shape_file_path)
+            bands = ["B2", "B3", "B4", "B8", "B11", "B12"]
+
+            committed = queue.run_worker(lambda unit, arrays_folder: sut.save_work_unit_arrays(
+                raster_file_path, raster_meta, coverage_engine, arrays_folder, unit.get("tiles_coordinates"), bands))
+
+            with open(queue.merge()) as f:
+                index = json.load(f)
+
+            self.assertEqual(4, committed)
+            self.assertEqual([
+                "results/unit_000000/array_0_0_20210101_20210131_0000000000.npy",
+                "results/unit_000000/array_0_256_20210101_20210131_0000000000.npy",
+                "results/unit_000001/array_256_0_20210101_20210131_0000000000.npy",
+                "results/unit_000001/array_256_256_20210101_20210131_0000000000.npy"
+            ], index.get("arrays"))
+
+            for array in index.get("arrays"):
+                result = np.load(os.path.join(queue.queue_dir, array))
+                self.assertEqual((4, 512, 512), result.shape)
+                self.assertTrue(result[0].all())
@@ -0,0 +1,205 @@
+import json
+import os
+import tempfile
+import time
+import unittest
+from multiprocessing import Process
+
+from providers.TilesWorkQueue import TilesWorkQueue
+from providers.data.dataclasses import WorkQueueParams
+
+PARAMS = WorkQueueParams(windows_per_unit=3, lease_seconds=60, poll_seconds=0.05)
+
+
+def _save_unit(unit: dict, arrays_folder: str) -> list:
+    file_names = []
+    for col_off, row_off in unit.get("tiles_coordinates"):
+        file_name = f"array_{col_off}_{row_off}.npy"
+        open(os.path.join(arrays_folder, file_name), "w").close()
+        file_names.append(file_name)
+    return file_names
+
+
+def _save_unit_or_fail(unit: dict, arrays_folder: str) -> list:
+    if unit.get("unit_id") == "unit_000001":
+        raise ValueError("Poison unit")
+    return _save_unit(unit, arrays_folder)
+
+
+def _save_unit_slowly(unit: dict, arrays_folder: str) -> list:
+    time.sleep(1.5)
+    return _save_unit(unit, arrays_folder)
+
+
+def _run_worker(queue_dir: str, worker_id: str, params: WorkQueueParams = PARAMS, process_unit=_save_unit) -> None:
+    TilesWorkQueue(queue_dir, params).run_worker(process_unit, worker_id)
+
+
+class TilesWorkQueueTest(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.queue_dir = self.tmp_dir.name
+        self.tiles_coordinates = [(x, y) for x in range(0, 512, 128) for y in range(0, 512, 128)]
+
+    def tearDown(self):
+        self.tmp_dir.cleanup()
+
+    def test_create(self):
+        sut = TilesWorkQueue(self.queue_dir, PARAMS)
+
+        result = sut.create({"bands": ["B2"]}, self.tiles_coordinates)
+
+        self.assertEqual(6, result)
+        self.assertEqual(6, len(os.listdir(sut.pending_dir)))
+        self.assertEqual({"bands": ["B2"]}, sut.load_job())
+        self.assertRaises(FileExistsError, sut.create, {}, self.tiles_coordinates)
+
+    def test_run_workers_and_merge(self):
+        TilesWorkQueue(self.queue_dir, PARAMS).create({}, self.tiles_coordinates)
+
+        workers = [Process(target=_run_worker, args=(self.queue_dir, f"node-{n}")) for n in range(4)]
+        for worker in workers:
+            worker.start()
+        for worker in workers:
+            worker.join()
+
+        sut = TilesWorkQueue(self.queue_dir, PARAMS)
+
+        with open(sut.merge()) as f:
+            index = json.load(f)
+
+        self.assertTrue(sut.is_finished())
+        self.assertEqual(16, len(index.get("arrays")))
+        self.assertEqual(16, len(set(index.get("arrays"))))
+        for array in index.get("arrays"):
+            self.assertTrue(os.path.exists(os.path.join(self.queue_dir, array)))
+
+    def test_run_workers_longer_than_lease(self):
+        params = WorkQueueParams(windows_per_unit=8, lease_seconds=1, poll_seconds=0.05)
+        TilesWorkQueue(self.queue_dir, params).create({}, self.tiles_coordinates)
+
+        workers = [
+            Process(target=_run_worker, args=(self.queue_dir, f"node-{n}", params, _save_unit_slowly))
+            for n in range(2)]
+        for worker in workers:
+            worker.start()
+        for worker in workers:
+            worker.join(timeout=30)
+
+        alive_workers = [worker for worker in workers if worker.is_alive()]
+        for worker in alive_workers:
+            worker.terminate()
+
+        sut = TilesWorkQueue(self.queue_dir, params)
+
+        self.assertEqual([], alive_workers)
+        self.assertTrue(sut.is_finished())
+        self.assertEqual(2, len(os.listdir(sut.done_dir)))
+
+        with open(sut.merge()) as f:
+            self.assertEqual(16, len(json.load(f).get("arrays")))
+
+    def test_run_workers_with_failing_unit(self):
+        TilesWorkQueue(self.queue_dir, PARAMS).create({}, self.tiles_coordinates)
+
+        workers = [
+            Process(target=_run_worker, args=(self.queue_dir, f"node-{n}", PARAMS, _save_unit_or_fail))
+            for n in range(2)]
+        for worker in workers:
+            worker.start()
+        for worker in workers:
+            worker.join(timeout=30)
+
+        sut = TilesWorkQueue(self.queue_dir, PARAMS)
+
+        self.assertTrue(sut.is_finished())
+        self.assertEqual(["unit_000001.json"], os.listdir(sut.failed_dir))
+        with open(os.path.join(sut.failed_dir, "unit_000001.json")) as f:
+            self.assertEqual(3, json.load(f).get("attempts"))
+        self.assertEqual(5, len(os.listdir(sut.done_dir)))
+        self.assertEqual(5, len(os.listdir(sut.results_dir)))
+
+        with open(sut.merge()) as f:
+            index = json.load(f)
+
+        self.assertEqual(["unit_000001"], index.get("failed"))
+        self.assertEqual(13, len(index.get("arrays")))
+
+    def test_claim_old_pending_unit(self):
+        sut = TilesWorkQueue(self.queue_dir, PARAMS)
+        sut.create({}, self.tiles_coordinates)
+
+        # Pending for hours before being claimed
+        for name in os.listdir(sut.pending_dir):
+            os.utime(os.path.join(sut.pending_dir, name), (time.time() - 3600, time.time() - 3600))
+
+        unit, leased_file_path = sut.claim("node")
+
+        self.assertEqual(0, sut.requeue_expired())
+        self.assertGreater(os.stat(leased_file_path).st_mtime, time.time())
+
+    def test_requeue_expired(self):
+        sut = TilesWorkQueue(self.queue_dir, WorkQueueParams(windows_per_unit=3, lease_seconds=1, poll_seconds=0))
+        sut.create({}, self.tiles_coordinates)
+
+        unit, leased_file_path = sut.claim("lost-node")
+        self.assertEqual(0, sut.requeue_expired())
+        self.assertAlmostEqual(time.time() + 1, os.stat(leased_file_path).st_mtime, delta=0.5)
+
+        # Expiry set in the past, as if the lease had not been renewed
+        os.utime(leased_file_path, (time.time() - 1, time.time() - 1))
+
+        self.assertEqual(1, sut.requeue_expired())
+        self.assertFalse(sut.renew(leased_file_path))
+
+        tmp_results_dir = os.path.join(sut.results_dir, "tmp")
+        os.makedirs(tmp_results_dir)
+        self.assertFalse(sut.commit(unit, leased_file_path, tmp_results_dir, []))
+        self.assertFalse(os.path.exists(tmp_results_dir))
+
+        self.assertEqual(6, sut.run_worker(_save_unit, "node"))
+
+    def test_run_worker_after_worker_died(self):
+        sut = TilesWorkQueue(self.queue_dir, WorkQueueParams(windows_per_unit=16, lease_seconds=1, poll_seconds=0))
+        sut.create({}, self.tiles_coordinates)
+
+        # The worker dies holding the lease with partial results, before moving the unit out of leased
+        unit, leased_file_path = sut.claim("dead-node")
+        os.utime(leased_file_path, (time.time() - 1, time.time() - 1))
+        tmp_results_dir = os.path.join(sut.results_dir, ".unit_000000.dead-node.tmp")
+        os.makedirs(tmp_results_dir)
+        _save_unit({"tiles_coordinates": unit.get("tiles_coordinates")[:2]}, tmp_results_dir)
+
+        self.assertFalse(sut.is_finished())
+        self.assertEqual(1, sut.run_worker(_save_unit, "node"))
+
+        with open(sut.merge()) as f:
+            index = json.load(f)
+
+        self.assertEqual(16, len(index.get("arrays")))
+        self.assertEqual([], index.get("failed"))
+        self.assertEqual(["unit_000000"], os.listdir(sut.results_dir))
+
+    def test_run_worker_after_workers_killed_by_unit(self):
+        sut = TilesWorkQueue(self.queue_dir, WorkQueueParams(windows_per_unit=16, lease_seconds=1, poll_seconds=0))
+        sut.create({}, self.tiles_coordinates)
+
+        # Every worker dies processing the unit, the lease expires and the unit is requeued
+        for attempt in range(1, 4):
+            unit, leased_file_path = sut.claim(f"dead-node-{attempt}")
+            self.assertEqual(attempt, unit.get("attempts"))
+            os.utime(leased_file_path, (time.time() - 1, time.time() - 1))
+            self.assertEqual(1, sut.requeue_expired())
+
+        self.assertEqual(0, sut.run_worker(_save_unit, "node"))
+        self.assertEqual(["unit_000000.json"], os.listdir(sut.failed_dir))
+
+        with open(sut.merge()) as f:
+            self.assertEqual(["unit_000000"], json.load(f).get("failed"))
+
+    def test_merge_not_finished(self):
+        sut = TilesWorkQueue(self.queue_dir, PARAMS)
+        sut.create({}, self.tiles_coordinates)
+
+        self.assertRaises(RuntimeError, sut.merge)